@@ -1,17 +1,19 @@
 import streamlit as st
 import srt
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from typing import List, Dict, Any
 import yaml
 import tempfile
 from datetime import datetime
 import zipfile
 import io
+import json
+import hashlib
+import logging
 
 from config import (
     OPENAI_API_KEY,
-    TEMP_DIR,
     ALLOWED_EXTENSIONS,
     MAX_FILE_SIZE,
     ERROR_MESSAGES
@@ -20,9 +22,17 @@ from utils import (
     combine_subtitles,
     analyze_content,
     check_and_split_yaml,
-    format_yaml_for_preview
+    format_yaml_for_preview,
+    write_yaml,
+    build_part_requests,
+    submit_batch,
+    retrieve_batch_results,
+    finalize_yaml_parts,
+    create_async_client
 )
 
+log = logging.getLogger(__name__)
+
 # ページ設定
 st.set_page_config(
     page_title="字幕からスライド用YAMLジェネレーター",
@@ -39,15 +49,34 @@ st.sidebar.write("""
 3. プレビューを確認
 4. YAMLファイルを個別または一括でダウンロード
 """)
+use_batch = st.sidebar.checkbox(
+    "Batch APIを使用する",
+    help="料金が約半額になる代わりに、解析の完了まで最大24時間かかります"
+)
+
+# OpenAI クライアントの初期化（接続プールを再実行・セッション間で再利用する）
+@st.cache_resource
+def get_sync_client() -> OpenAI:
+    return OpenAI(api_key=OPENAI_API_KEY)
 
-# OpenAI クライアントの初期化
-client = OpenAI(api_key=OPENAI_API_KEY)
+@st.cache_resource
+def get_async_client() -> AsyncOpenAI:
+    return create_async_client(OPENAI_API_KEY)
 
 # セッションステートの初期化
 if 'yaml_files' not in st.session_state:
     st.session_state.yaml_files = None
 if 'last_processed_file' not in st.session_state:
     st.session_state.last_processed_file = None
+if 'batch_id' not in st.session_state:
+    st.session_state.batch_id = None
+if 'batch_num_requests' not in st.session_state:
+    st.session_state.batch_num_requests = None
+if 'batch_status' not in st.session_state:
+    st.session_state.batch_status = None
+if 'zip_cache' not in st.session_state:
+    # (YAMLデータのハッシュ, ZIPデータ, ZIPファイル名, 基本ファイル名)
+    st.session_state.zip_cache = None
 
 def create_zip_file(yaml_files: List[Dict[str, Any]], base_filename: str) -> tuple[bytes, str]:
     """
@@ -62,81 +91,98 @@ def create_zip_file(yaml_files: List[Dict[str, Any]], base_filename: str) -> tup
     """
     zip_buffer = io.BytesIO()
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+    # 速度を優先して最も軽い圧縮レベルを使う
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_file:
         for i, yaml_data in enumerate(yaml_files, 1):
             # 個別のYAMLファイル名を生成
             yaml_filename = f"{base_filename}_{i}.txt"
-            # YAMLデータを文字列に変換
-            yaml_content = format_yaml_for_preview(yaml_data)
-            # ZIPファイルに追加
-            zip_file.writestr(yaml_filename, yaml_content)
+            # 中間の文字列を作らずに、YAMLデータをZIPエントリへ直接書き出す
+            with zip_file.open(yaml_filename, 'w', force_zip64=True) as entry:
+                write_yaml(yaml_data, entry)
     
     return zip_buffer.getvalue(), f"{base_filename}.zip"
 
+# キャッシュはプロセス全体で共有されるため、件数と保持期間を制限する
+# （1回のアップロードで最大8ファイル分のプレビューを作る）
+@st.cache_data(max_entries=64, ttl=3600)
+def preview_yaml(yaml_json: str) -> str:
+    """
+    JSON文字列に変換したYAMLデータをキーに、プレビュー用のYAML文字列をキャッシュする
+    （再実行のたびに yaml.dump し直さないため）
+    """
+    return format_yaml_for_preview(json.loads(yaml_json))
+
 def process_text_content(content: str) -> List[Dict[str, Any]]:
     """テキストコンテンツを処理してYAMLデータのリストを返す"""
     try:
-        print("\n=== テキスト処理開始 ===")
-        print(f"入力テキスト長: {len(content)}")
+        log.debug("テキスト処理開始（入力テキスト長: %d）", len(content))
         # OpenAI APIで内容を解析
-        yaml_data = analyze_content(client, content)
-        print("OpenAI APIでの解析が完了")
+        yaml_data = analyze_content(get_async_client(), content)
+        log.debug("OpenAI APIでの解析が完了")
         # YAMLデータを分割
         yaml_files = check_and_split_yaml(yaml_data)
-        print(f"YAMLファイル数: {len(yaml_files)}")
+        log.debug("YAMLファイル数: %d", len(yaml_files))
         return yaml_files
     except Exception as e:
-        import traceback
-        print("\n=== テキスト処理エラー ===")
-        print(f"エラーの種類: {type(e).__name__}")
-        print(f"エラーメッセージ: {str(e)}")
-        print("スタックトレース:")
-        traceback.print_exc()
+        log.exception("テキスト処理エラー")
         st.error(f"エラーが発生しました: {str(e)}")
         return []
 
+def load_uploaded_text(uploaded_file) -> str:
+    """アップロードされたファイルを解析用のテキストに変換する"""
+    # ファイル拡張子の確認
+    file_ext = os.path.splitext(uploaded_file.name)[1].lower()
+    
+    # ファイルの読み込み（一時ファイルを経由せず、メモリ上でデコードする）
+    data = uploaded_file.getvalue()
+    try:
+        # BOM付きUTF-8（Windowsで書き出されたファイルに多い）にも対応する
+        content = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Windowsで作成されたShift_JISのファイルにも対応する
+        content = data.decode('cp932')
+    
+    if file_ext == '.srt':
+        # SRTファイルの場合
+        log.debug("SRTファイルの処理を開始: %s", uploaded_file.name)
+        # リストにせず、ジェネレータのまま1回の走査で結合する
+        combined_text = combine_subtitles(srt.parse(content))
+        log.debug("結合後のテキスト長: %d", len(combined_text))
+        return combined_text
+    else:
+        # テキストファイルの場合
+        log.debug("テキストファイルの処理を開始: %s（テキスト長: %d）", uploaded_file.name, len(content))
+        return content
+
 def process_srt_file(uploaded_file) -> List[Dict[str, Any]]:
     """SRTファイルを処理してYAMLデータのリストを返す"""
-    # ファイルを一時ディレクトリに保存
-    temp_path = os.path.join(TEMP_DIR, uploaded_file.name)
-    with open(temp_path, 'wb') as f:
-        f.write(uploaded_file.getbuffer())
-
     try:
-        # ファイル拡張子の確認
-        file_ext = os.path.splitext(uploaded_file.name)[1].lower()
-        
-        # ファイルの読み込み
-        with open(temp_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        if file_ext == '.srt':
-            # SRTファイルの場合
-            print(f"SRTファイルの処理を開始: {uploaded_file.name}")
-            subtitles = list(srt.parse(content))
-            print(f"字幕数: {len(subtitles)}")
-            combined_text = combine_subtitles(subtitles)
-            print(f"結合後のテキスト長: {len(combined_text)}")
-            return process_text_content(combined_text)
-        else:
-            # テキストファイルの場合
-            print(f"テキストファイルの処理を開始: {uploaded_file.name}")
-            print(f"テキスト長: {len(content)}")
-            return process_text_content(content)
+        return process_text_content(load_uploaded_text(uploaded_file))
     
     except Exception as e:
-        import traceback
-        print("\n=== エラーの詳細 ===")
-        print(f"エラーの種類: {type(e).__name__}")
-        print(f"エラーメッセージ: {str(e)}")
-        print("スタックトレース:")
-        traceback.print_exc()
+        log.exception("ファイル処理エラー")
         st.error(f"エラーが発生しました: {str(e)}")
         return []
-    finally:
-        # 一時ファイルの削除
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+
+def check_batch_status() -> None:
+    """バッチの状態を確認し、完了していれば結果を取り込む"""
+    try:
+        yaml_parts = retrieve_batch_results(
+            get_sync_client(), st.session_state.batch_id, st.session_state.batch_num_requests
+        )
+        if yaml_parts is None:
+            st.session_state.batch_status = "バッチはまだ処理中です。しばらくしてから再度確認してください。"
+            return
+        
+        yaml_data = finalize_yaml_parts(get_async_client(), yaml_parts)
+        st.session_state.yaml_files = check_and_split_yaml(yaml_data)
+        st.session_state.batch_status = None
+    except Exception as e:
+        log.exception("バッチ処理エラー")
+        st.session_state.yaml_files = []
+        st.session_state.batch_status = f"エラーが発生しました: {str(e)}"
+    st.session_state.batch_id = None
+    st.session_state.batch_num_requests = None
 
 def main():
     # ファイルアップロード
@@ -160,12 +206,21 @@ def main():
 
         # 新しいファイルがアップロードされた場合のみ処理を実行
         if (st.session_state.last_processed_file != uploaded_file.name or 
-            st.session_state.yaml_files is None):
+            (st.session_state.yaml_files is None and st.session_state.batch_id is None)):
             
             with st.spinner("ファイルを処理中..."):
                 try:
-                    # ファイルの処理
-                    st.session_state.yaml_files = process_srt_file(uploaded_file)
+                    if use_batch:
+                        # Batch APIに投入し、結果は後から取得する
+                        text = load_uploaded_text(uploaded_file)
+                        st.session_state.yaml_files = None
+                        st.session_state.batch_status = None
+                        requests = build_part_requests(text)
+                        st.session_state.batch_id = submit_batch(get_sync_client(), requests)
+                        st.session_state.batch_num_requests = len(requests)
+                    else:
+                        # ファイルの処理
+                        st.session_state.yaml_files = process_srt_file(uploaded_file)
                     st.session_state.last_processed_file = uploaded_file.name
                     
                 except Exception as e:
@@ -173,13 +228,28 @@ def main():
                     st.error(f"詳細: {str(e)}")
                     return
 
+        # バッチ処理の状態表示
+        if st.session_state.batch_id is not None:
+            st.info(f"Batch APIで解析中です（バッチID: {st.session_state.batch_id}）。完了まで最大24時間かかります。")
+            st.button("バッチの状態を確認", on_click=check_batch_status)
+        if st.session_state.batch_status:
+            st.warning(st.session_state.batch_status)
+
         # 解析結果の表示と処理
         if st.session_state.yaml_files:
             # 一括ダウンロードボタンを表示
             st.subheader("一括ダウンロード")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            base_filename = f"lecture_content_{timestamp}"
-            zip_data, zip_filename = create_zip_file(st.session_state.yaml_files, base_filename)
+            # 内容が変わったときだけZIPを作り直す（タイムスタンプも作成時のものを使い続ける）
+            zip_key = hashlib.blake2b(
+                json.dumps(st.session_state.yaml_files, sort_keys=True, ensure_ascii=False).encode("utf-8"),
+                digest_size=16
+            ).hexdigest()
+            if st.session_state.zip_cache is None or st.session_state.zip_cache[0] != zip_key:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                base_filename = f"lecture_content_{timestamp}"
+                zip_data, zip_filename = create_zip_file(st.session_state.yaml_files, base_filename)
+                st.session_state.zip_cache = (zip_key, zip_data, zip_filename, base_filename)
+            _, zip_data, zip_filename, base_filename = st.session_state.zip_cache
             
             st.download_button(
                 label="全てのYAMLファイルをZIPでダウンロード",
@@ -226,7 +296,8 @@ def main():
                     
                     # YAMLデータの表示（折りたたみ可能）
                     with st.expander("YAMLデータを表示"):
-                        preview_text = format_yaml_for_preview(yaml_data)
+                        # キーの順序を保つため sort_keys は指定しない
+                        preview_text = preview_yaml(json.dumps(yaml_data, ensure_ascii=False))
                         st.code(preview_text, language="yaml")
                     
                     # 個別ダウンロードボタン
@@ -239,6 +310,4 @@ def main():
                     )
 
 if __name__ == "__main__":
-    # 一時ディレクトリの作成
-    os.makedirs(TEMP_DIR, exist_ok=True)
     main() 
\ No newline at end of file
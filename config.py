@@ -1,13 +1,24 @@
 import os
+import logging
 from dotenv import load_dotenv
 import tempfile
 
 # 環境変数の読み込み
 load_dotenv()
 
+# ログ設定（デバッグ出力が必要な場合は LOG_LEVEL=DEBUG を指定する）
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+
 # OpenAI API設定
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4.1-2025-04-14"
+OPENAI_MAX_CONCURRENCY = 12  # OpenAI APIへの最大同時リクエスト数
+# 全パートを1リクエストで解析するのは、パート数 × 1パートあたりの出力見込みが上限に収まる場合に限る
+# （SYSTEM_PROMPTは1パートあたり10000〜12000文字の出力を求めるため、日本語とJSONのキーを合わせて約12000トークンと見積もる）
+ANALYSIS_PART_OUTPUT_TOKENS = 12000  # 1パートあたりの出力トークン数の見込み
+COMBINED_ANALYSIS_MAX_TOKENS = 32768  # 一括解析の最大出力トークン数（OPENAI_MODELの出力上限）
+SUMMARIZE_MODEL = "gpt-4.1-mini"  # 要約・拡充などの補助的な処理に使う軽量モデル
+SUMMARIZE_MAX_TOKENS = 32768  # SUMMARIZE_MODELの最大出力トークン数
 
 
 # YAMLファイル設定
@@ -16,6 +27,11 @@ MAX_FILE_SIZE = 10 * 1024 * 1024  # 最大ファイルサイズ（10MB）
 
 # アプリケーション設定
 TEMP_DIR = tempfile.gettempdir()  # システムの一時ディレクトリを使用
+# 解析結果のキャッシュ保存先（共有の一時ディレクトリではなく、ユーザー専用のキャッシュディレクトリを使う）
+CACHE_DIR = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "srt2slide"
+)
 ALLOWED_EXTENSIONS = {".srt", ".txt"}  # 許可する拡張子
 
 # エラーメッセージ
@@ -3,12 +3,11 @@ SYSTEM_PROMPT = """
 以下の要件に従って、入力されたテキストを構造化してください：
 
 1. 出力形式：
-   - YAML形式で出力
-   - 階層構造：講義名 > ファイル番号 > セクション > スライド
-   - 各スライドには必ず以下の情報を含めること（特に講義台本は必須）：
+   - JSON形式で出力（4. の形式に示すキー以外は含めない）
+   - 階層構造：講義名 > セクション > スライド
+   - 各スライドには必ず以下の情報を含めること：
      - タイトル（スライドの内容を端的に表す20文字程度の具体的なもの）
      - 内容（5-7項目の箇条書き、各項目は30-50文字程度の具体的な説明）
-     - 講義台本（300-500文字の詳細解説、話者の言い回しや例え話を含む）
      - 指導のポイント（3-5項目、各30-50文字程度）
    - 1ファイルあたりの文字数は10000〜12000文字を目安とする
    - 必ず内容を拡充すること。以下の方法を積極的に用いる：
@@ -27,49 +26,126 @@ SYSTEM_PROMPT = """
    - 重要な数値データや固有名詞は必ず保持し、関連情報も追加
    - 一般論に終わらせず、具体的な実践手法や応用例まで掘り下げる
 
-3. 講義台本の作成（最重要）：
-   - 各スライドに300-500文字の詳細な講義台本を必ず作成
-   - 講義台本には以下の要素を含める：
-     - 内容の各箇条書き項目の詳細な解説
-     - 講師が話すような口調とリズム
-     - 具体的な例示や事例紹介
-     - 質問形式での問いかけや聴衆への語りかけ
-     - 業界の最新トレンドや関連する補足情報
-   - 台本は単なる箇条書きの言い換えではなく、より深い洞察や背景情報を提供するもの
-
-4. タイトルと指導のポイント：
+3. タイトルと指導のポイント：
    - スライドの内容を具体的に表現する明確なタイトルを付ける
    - 各スライドで強調すべき点を詳細な指導のポイントとして抽出（最低3-5点）
    - 指導のポイントは単なる内容の要約ではなく、教える際の重要ポイントや注意点
    - 話者の意図や感情も可能な限り指導のポイントに含める
    - 受講者の理解度を高めるための質問例や議論テーマも含める
 
-5. 形式：
-lecture_name: 講義名
-file_number: ファイル番号
-sections:
-  - name: セクション名
-    slides:
-      - title: スライドタイトル
-        content:
-          - 箇条書き1（具体的な説明を含める、30-50文字）
-          - 箇条書き2（例示や数値を含める、30-50文字）
-          - 箇条書き3（重要なポイントを詳細に、30-50文字）
-          - 箇条書き4（実践的な適用方法、30-50文字）
-          - 箇条書き5（関連する概念や手法、30-50文字）
-        script: |
-          ここに300-500文字の詳細な講義台本を記載します。箇条書きの内容をさらに深く掘り下げ、
-          具体例や事例、業界の最新動向なども含めて解説します。講師が実際に話すような
-          口調で、質問や問いかけなども取り入れます。受講者が理解しやすいように
-          専門用語の説明や背景情報も適宜盛り込みます。
-        teaching_points:
-          - 指導のポイント1（話者の意図を含める、30-50文字）
-          - 指導のポイント2（具体的な説明方法を含める、30-50文字）
-          - 指導のポイント3（強調すべき要素を含める、30-50文字）
-          - 指導のポイント4（よくある誤解や注意点、30-50文字）
-
-入力されたテキストを上記の要件に従って変換し、できるだけ詳細な情報を保持した構造化されたYAMLデータを生成してください。
+4. 形式：
+{
+  "lecture_name": "講義名",
+  "sections": [
+    {
+      "name": "セクション名",
+      "slides": [
+        {
+          "title": "スライドタイトル",
+          "content": [
+            "箇条書き1（具体的な説明を含める、30-50文字）",
+            "箇条書き2（例示や数値を含める、30-50文字）",
+            "箇条書き3（重要なポイントを詳細に、30-50文字）",
+            "箇条書き4（実践的な適用方法、30-50文字）",
+            "箇条書き5（関連する概念や手法、30-50文字）"
+          ],
+          "teaching_points": [
+            "指導のポイント1（話者の意図を含める、30-50文字）",
+            "指導のポイント2（具体的な説明方法を含める、30-50文字）",
+            "指導のポイント3（強調すべき要素を含める、30-50文字）",
+            "指導のポイント4（よくある誤解や注意点、30-50文字）"
+          ]
+        }
+      ]
+    }
+  ]
+}
+
+入力されたテキストを上記の要件に従って変換し、できるだけ詳細な情報を保持した構造化されたJSONデータを生成してください。
 要約は最小限に抑え、元の内容をできるだけ保持しつつ、さらに内容を拡充して各スライドを充実させてください。
-必ず各スライドに講義台本（script）を追加し、単なる箇条書きの羅列にならないようにしてください。
 文字数が目標に達していない場合は、さらに内容の拡充を行い、具体例や実践的な応用例を追加してください。
-""" 
\ No newline at end of file
+"""
+
+BATCHED_PARTS_PROMPT = """
+以下は1つの講義を{total_parts}個のパートに分割したテキストです。各パートは「===PART n/{total_parts}===」で区切られています。
+全体の文脈を考慮しながらパートごとに解析し、結果を次の形式のJSONオブジェクトで出力してください：
+{{"parts": [パート1の解析結果, パート2の解析結果, ...]}}
+各パートの解析結果はシステムプロンプトの形式（lecture_name, sections）と同じ構造のオブジェクトとし、parts配列にはパート順に{total_parts}個の要素を必ず含めてください。
+"""
+
+# 要約・拡充（adjust_yaml_size_async）で使用するプロンプト
+SUMMARIZE_SYSTEM_PROMPT = "与えられたテキストを自然な形で要約してください。重要なポイントを保持しながら、箇条書きの場合は文章を途中で切らないように注意してください。"
+
+CONTENT_EXPANSION_PROMPT = """
+以下の内容をより詳細に展開してください：
+- 各ポイントに具体例を追加
+- 関連する補足情報を含める
+- 実践的な応用例を追加
+
+元の内容：
+{content_text}
+"""
+
+TEACHING_POINTS_EXPANSION_PROMPT = """
+以下の指導ポイントをより詳細に展開してください：
+- 具体的な指導方法を追加
+- 予想される質問や疑問点への対応
+- 実践的なアドバイスを含める
+
+元のポイント：
+{points_text}
+"""
+
+CONTENT_LIMIT_PROMPT = "以下の内容を5つの重要なポイントにまとめてください。各ポイントは完結した文章にしてください：\n{combined_points}"
+
+SLIDE_SUMMARY_PROMPT = """
+以下のスライド群を10個の重要なスライドに要約してください。
+結果は次の形式のJSONオブジェクトで出力してください：
+{{"slides": [{{"title": "タイトル", "content": ["箇条書き1", "箇条書き2"], "teaching_points": "指導のポイント"}}]}}
+
+元のスライド内容：
+{combined_slides}
+"""
+
+# Structured Outputs（response_format=json_schema）で使用する講義データのスキーマ
+LECTURE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "lecture_name": {"type": "string"},
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "slides": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "title": {"type": "string"},
+                                "content": {"type": "array", "items": {"type": "string"}},
+                                "teaching_points": {"type": "array", "items": {"type": "string"}}
+                            },
+                            "required": ["title", "content", "teaching_points"],
+                            "additionalProperties": False
+                        }
+                    }
+                },
+                "required": ["name", "slides"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["lecture_name", "sections"],
+    "additionalProperties": False
+}
+
+LECTURE_PARTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "parts": {"type": "array", "items": LECTURE_SCHEMA}
+    },
+    "required": ["parts"],
+    "additionalProperties": False
+}
@@ -0,0 +1,72 @@
+import math
+import random
+
+import pytest
+import srt
+
+from utils import check_and_split_yaml, combine_subtitles, split_text
+
+
+def test_combine_subtitles_keeps_first_block_after_bom():
+    data = (
+        "\ufeff1\n00:00:01,000 --> 00:00:02,000\nhello\nSpk\nworld\n\n"
+        "2\n00:00:02,000 --> 00:00:03,000\nx\nB\ny\n"
+    ).encode("utf-8")
+    for encoding in ("utf-8", "utf-8-sig"):
+        content = data.decode(encoding)
+        assert combine_subtitles(srt.parse(content)) == "Spk：world\n\nB：y\n\n"
+
+
+def test_combine_subtitles_does_not_merge_empty_body_into_next_block():
+    content = (
+        "1\n00:00:01,000 --> 00:00:02,000\n\n"
+        "2\n00:00:02,000 --> 00:00:03,000\nfoo\nSpk\nbar\n"
+    )
+    assert combine_subtitles(srt.parse(content)) == "不明：\n\nSpk：bar\n\n"
+
+
+def _split_text_by_list(text, num_parts=8):
+    # 段落のリストを作って結合していた以前の split_text の実装
+    paragraphs = [p for p in text.split('\n\n') if p.strip()]
+    if len(paragraphs) <= num_parts:
+        return paragraphs
+    paragraphs_per_part = math.ceil(len(paragraphs) / num_parts)
+    return [
+        '\n\n'.join(paragraphs[i:i + paragraphs_per_part])
+        for i in range(0, len(paragraphs), paragraphs_per_part)
+    ]
+
+
+@pytest.mark.parametrize("text, num_parts", [
+    ("", 8),
+    (" \n\n\t\n\n", 8),
+    ("a\n\nb\n\nc", 8),
+    ("a\n\n\nb\n\n\n\nc\n\n", 2),
+    ("a\n\n \n\nb\n\nc\n\nd", 2),
+    ("\n\na\n\n\n\n\n\nb\n\nc\n\n  \n\nd\n\ne", 2),
+    ("\n\n".join(f"段落{i}" for i in range(17)), 8),
+])
+def test_split_text_matches_list_based_split(text, num_parts):
+    assert split_text(text, num_parts) == _split_text_by_list(text, num_parts)
+
+
+def test_split_text_matches_list_based_split_on_random_text():
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = "".join(rng.choice(["a", "b", " ", "\n", "\n\n", "\n\n\n"]) for _ in range(rng.randint(0, 40)))
+        num_parts = rng.randint(1, 8)
+        assert split_text(text, num_parts) == _split_text_by_list(text, num_parts)
+
+
+def test_check_and_split_yaml_spreads_remainder_over_leading_parts():
+    yaml_data = {"lecture_name": "講義", "file": list(range(17))}
+    parts = check_and_split_yaml(yaml_data)
+    assert [len(part["file"]) for part in parts] == [3, 2, 2, 2, 2, 2, 2, 2]
+    assert [entry for part in parts for entry in part["file"]] == list(range(17))
+    assert all(part["lecture_name"] == "講義" for part in parts)
+
+
+def test_check_and_split_yaml_skips_empty_parts_when_fewer_entries_than_parts():
+    yaml_data = {"lecture_name": "講義", "file": ["a", "b", "c"]}
+    parts = check_and_split_yaml(yaml_data)
+    assert [part["file"] for part in parts] == [["a"], ["b"], ["c"]]
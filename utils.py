@@ -1,13 +1,179 @@
 import yaml
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterable
 import srt
 from openai import OpenAI
 import json
-from prompts import SYSTEM_PROMPT
+from prompts import (
+    SYSTEM_PROMPT, BATCHED_PARTS_PROMPT, LECTURE_SCHEMA, LECTURE_PARTS_SCHEMA,
+    SUMMARIZE_SYSTEM_PROMPT, CONTENT_EXPANSION_PROMPT, TEACHING_POINTS_EXPANSION_PROMPT,
+    CONTENT_LIMIT_PROMPT, SLIDE_SUMMARY_PROMPT
+)
 import math
+import itertools
+import re
+import io
+import os
+import hashlib
+from collections import OrderedDict
+import logging
 import asyncio
-from openai import AsyncOpenAI
+import threading
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, NOT_GIVEN
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from config import (
+    OPENAI_MODEL, CACHE_DIR, OPENAI_MAX_CONCURRENCY, SUMMARIZE_MODEL, SUMMARIZE_MAX_TOKENS,
+    ANALYSIS_PART_OUTPUT_TOKENS, COMBINED_ANALYSIS_MAX_TOKENS
+)
+
+log = logging.getLogger(__name__)
+
+# libyamlが利用可能な場合はC実装のダンパーを使用する
+try:
+    from yaml import CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
+# OpenAI APIへの同時リクエスト数を制限するセマフォ
+# （全ての非同期処理は run_async の共有イベントループ上で実行されるため、モジュール単位で1つ持てばよい）
+_SEM = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# 非同期処理を実行する共有イベントループ（別スレッドで常駐させる）
+_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+def run_async(coro):
+    """
+    共有イベントループ上でコルーチンを実行し、結果を返す
+    
+    AsyncOpenAIの接続プールは作成されたイベントループに紐づくため、
+    asyncio.run で毎回ループを作り直さずに同じループを使い続ける
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="openai-event-loop", daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+def create_async_client(api_key: str) -> AsyncOpenAI:
+    """
+    HTTP/2とKeep-Aliveを有効にした非同期OpenAIクライアントを作成する
+    
+    Args:
+        api_key (str): OpenAI APIキー
+    
+    Returns:
+        AsyncOpenAI: パイプライン全体で共有する非同期OpenAIクライアント
+    """
+    http_client = DefaultAsyncHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=32)
+    )
+    return AsyncOpenAI(api_key=api_key, http_client=http_client)
+
+# キャッシュの保存形式や後処理の内容を変えた場合に上げるバージョン
+_CACHE_VERSION = 2
+
+# プロンプトやスキーマが変わった場合にキャッシュを無効化するためのハッシュ
+# （キャッシュする結果はサイズ調整後のものなので、要約・拡充のプロンプトも含める）
+_PROMPT_HASH = hashlib.sha256(
+    "\0".join([
+        SYSTEM_PROMPT, BATCHED_PARTS_PROMPT, json.dumps(LECTURE_SCHEMA, sort_keys=True),
+        SUMMARIZE_SYSTEM_PROMPT, CONTENT_EXPANSION_PROMPT, TEACHING_POINTS_EXPANSION_PROMPT,
+        CONTENT_LIMIT_PROMPT, SLIDE_SUMMARY_PROMPT
+    ]).encode("utf-8")
+).hexdigest()
+
+# パート単位の解析結果のLRUキャッシュ（部分的な再実行で成功済みのパートを再利用する）
+_PART_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_PART_CACHE_MAXSIZE = 128
+
+def _part_cache_key(part: str, part_num: int, total_parts: int) -> tuple:
+    """
+    パート単位の解析結果のキャッシュキーを作成する
+    """
+    return (hashlib.sha256(part.encode("utf-8")).hexdigest(), part_num, total_parts, OPENAI_MODEL, _PROMPT_HASH)
+
+def _store_part_cache(cache_key: tuple, yaml_data: Dict[str, Any]) -> None:
+    """
+    パート単位の解析結果をキャッシュし、上限を超えたら最も古いものを捨てる
+    """
+    _PART_CACHE[cache_key] = yaml_data
+    _PART_CACHE.move_to_end(cache_key)
+    if len(_PART_CACHE) > _PART_CACHE_MAXSIZE:
+        _PART_CACHE.popitem(last=False)
+
+def _private_cache_dir() -> Optional[str]:
+    """
+    キャッシュ用ディレクトリを用意し、他のユーザーから書き込めない場合のみそのパスを返す
+    """
+    try:
+        os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+        stat = os.stat(CACHE_DIR)
+    except OSError as e:
+        log.warning("キャッシュディレクトリを作成できません: %s", e)
+        return None
+    
+    if (hasattr(os, "getuid") and stat.st_uid != os.getuid()) or stat.st_mode & 0o022:
+        log.warning("キャッシュディレクトリ %s が他のユーザーから書き込み可能なため、キャッシュを使用しません", CACHE_DIR)
+        return None
+    return CACHE_DIR
+
+def _cache_path(text: str) -> Optional[str]:
+    """
+    モデル名・プロンプト・テキストのSHA256をキーとした、解析結果のキャッシュファイルのパスを返す
+    （キャッシュを使用できない場合はNone）
+    """
+    cache_dir = _private_cache_dir()
+    if cache_dir is None:
+        return None
+    
+    key = hashlib.sha256(
+        f"{_CACHE_VERSION}\0{OPENAI_MODEL}\0{SUMMARIZE_MODEL}\0{_PROMPT_HASH}\0{text}".encode("utf-8")
+    ).hexdigest()
+    return os.path.join(cache_dir, f"{key}.json")
+
+def _load_cached_result(text: str) -> Optional[Any]:
+    """
+    キャッシュされた解析結果を読み込む（存在しない場合はNone）
+    """
+    cache_path = _cache_path(text)
+    if cache_path is None or not os.path.exists(cache_path):
+        return None
+    
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            log.debug("キャッシュを使用します: %s", cache_path)
+            return json.load(f)
+    except Exception as e:
+        log.warning("キャッシュの読み込みに失敗しました: %s", e)
+        return None
+
+def _store_cached_result(text: str, result: Any) -> None:
+    """
+    解析結果をJSONでキャッシュに書き込む（書き込めなくても例外は送出しない）
+    """
+    cache_path = _cache_path(text)
+    if cache_path is None:
+        return
+    
+    # 書き込み途中のファイルを読まないよう、一時ファイルに書いてから置き換える
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        log.warning("キャッシュの書き込みに失敗しました: %s", e)
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+# 空白以外の文字を含むかどうかの判定用
+_NON_SPACE_RE = re.compile(r'\S')
 
 def split_text(text: str, num_parts: int = 8) -> List[str]:
     """
@@ -20,29 +186,44 @@ def split_text(text: str, num_parts: int = 8) -> List[str]:
     Returns:
         List[str]: 分割されたテキストのリスト
     """
-    # 段落で分割
-    paragraphs = [p for p in text.split('\n\n') if p.strip()]
+    # 空でない段落の開始・終了位置を1回の走査で求める（段落のリストは作らない）
+    starts = []
+    ends = []
+    pos = 0
+    while True:
+        nxt = text.find('\n\n', pos)
+        end = len(text) if nxt < 0 else nxt
+        if _NON_SPACE_RE.search(text, pos, end):
+            starts.append(pos)
+            ends.append(end)
+        if nxt < 0:
+            break
+        pos = nxt + 2
     
-    if len(paragraphs) <= num_parts:
-        return paragraphs
+    num_paragraphs = len(starts)
+    if num_paragraphs <= num_parts:
+        return [text[a:b] for a, b in zip(starts, ends)]
     
     # 段落数をnum_partsで割って、各部分の段落数を計算
-    paragraphs_per_part = math.ceil(len(paragraphs) / num_parts)
+    paragraphs_per_part = math.ceil(num_paragraphs / num_parts)
     
-    # テキストを分割
-    parts = []
-    for i in range(0, len(paragraphs), paragraphs_per_part):
-        part = '\n\n'.join(paragraphs[i:i + paragraphs_per_part])
-        if part.strip():  # 空の部分は除外
-            parts.append(part)
+    def join_paragraphs(first: int, last: int) -> str:
+        # 間に空の段落がなければ最初の段落の開始位置から最後の段落の終了位置までを切り出し、
+        # あれば空の段落を除いて結合する
+        if all(starts[k] == ends[k - 1] + 2 for k in range(first + 1, last)):
+            return text[starts[first]:ends[last - 1]]
+        return '\n\n'.join(text[starts[k]:ends[k]] for k in range(first, last))
     
-    return parts
+    return [
+        join_paragraphs(i, min(i + paragraphs_per_part, num_paragraphs))
+        for i in range(0, num_paragraphs, paragraphs_per_part)
+    ]
 
-def combine_subtitles(subtitles: List[srt.Subtitle]) -> str:
+def combine_subtitles(subtitles: Iterable[srt.Subtitle]) -> str:
     """
-    字幕を結合してテキストにする
+    字幕を結合してテキストにする（srt.parse のジェネレータをそのまま渡せば1回の走査で済む）
     """
-    combined_text = ""
+    out = []
     current_speaker = None
     current_text = []
     
@@ -61,15 +242,15 @@ def combine_subtitles(subtitles: List[srt.Subtitle]) -> str:
             current_text.append(text)
         else:
             if current_speaker is not None:
-                combined_text += f"{current_speaker}：{''.join(current_text)}\n\n"
+                out.append(f"{current_speaker}：{''.join(current_text)}\n\n")
             current_speaker = speaker
             current_text = [text]
     
     # 最後の話者の発話を追加
     if current_speaker is not None:
-        combined_text += f"{current_speaker}：{''.join(current_text)}\n\n"
+        out.append(f"{current_speaker}：{''.join(current_text)}\n\n")
     
-    return combined_text
+    return ''.join(out)
 
 def truncate_content(content: str, max_length: int = 100) -> str:
     """
@@ -86,6 +267,31 @@ def truncate_content(content: str, max_length: int = 100) -> str:
         return content
     return content[:max_length-3] + "..."
 
+def _part_request_body(part: str, part_num: int, total_parts: int) -> Dict[str, Any]:
+    """
+    パート解析用のChat Completionsリクエスト本文を作成する
+    """
+    return {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"これは講義の{part_num+1}/{total_parts}部分です。全体の文脈を考慮して解析してください。\n\n{part}"}
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "lecture", "schema": LECTURE_SCHEMA, "strict": True}
+        },
+        "temperature": 0.7
+    }
+
+def _parse_part_response(json_text: str, part_num: int) -> Dict[str, Any]:
+    """
+    パート解析のレスポンス（LECTURE_SCHEMAに従うJSON）を解析する
+    """
+    yaml_data = json.loads(json_text)
+    log.debug("パート %d のJSON解析に成功", part_num + 1)
+    return yaml_data
+
 async def analyze_content_part(client: AsyncOpenAI, part: str, part_num: int, total_parts: int = 8) -> Dict[str, Any]:
     """
     テキストの一部を非同期で解析する
@@ -99,99 +305,249 @@ async def analyze_content_part(client: AsyncOpenAI, part: str, part_num: int, to
     Returns:
         Dict[str, Any]: 解析結果
     """
-    print(f"\n=== パート {part_num+1}/{total_parts} の解析を開始 ===")
-    print(f"テキストの長さ: {len(part)} 文字")
+    log.debug("パート %d/%d の解析を開始（%d 文字）", part_num + 1, total_parts, len(part))
     
-    try:
+    cache_key = _part_cache_key(part, part_num, total_parts)
+    if cache_key in _PART_CACHE:
+        log.debug("パート %d はキャッシュを使用します", part_num + 1)
+        _PART_CACHE.move_to_end(cache_key)
+        return _PART_CACHE[cache_key]
+    
+    async with _SEM:
+        response = await client.chat.completions.create(
+            **_part_request_body(part, part_num, total_parts)
+        )
+    
+    json_text = response.choices[0].message.content
+    log.debug("パート %d のAPIレスポンスを受信", part_num + 1)
+    
+    yaml_data = _parse_part_response(json_text, part_num)
+    _store_part_cache(cache_key, yaml_data)
+    return yaml_data
+
+async def analyze_all_parts(client: AsyncOpenAI, parts: List[str]) -> List[Dict[str, Any]]:
+    """
+    全パートを1回のリクエストでまとめて解析する
+    
+    Args:
+        client (AsyncOpenAI): 非同期OpenAIクライアント
+        parts (List[str]): 解析するテキストのリスト
+    
+    Returns:
+        List[Dict[str, Any]]: パート順の解析結果
+    """
+    total_parts = len(parts)
+    log.debug("全%dパートを1リクエストで解析", total_parts)
+    
+    user_content = "\n\n".join(
+        f"===PART {i+1}/{total_parts}===\n{part}"
+        for i, part in enumerate(parts)
+    )
+    async with _SEM:
         response = await client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": f"これは講義の{part_num+1}/{total_parts}部分です。全体の文脈を考慮して解析してください。\n\n{part}"}
+                {"role": "user", "content": f"{BATCHED_PARTS_PROMPT.format(total_parts=total_parts)}\n{user_content}"}
             ],
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "lecture_parts", "schema": LECTURE_PARTS_SCHEMA, "strict": True}
+            },
+            max_completion_tokens=COMBINED_ANALYSIS_MAX_TOKENS,
             temperature=0.7
         )
-        
-        yaml_text = response.choices[0].message.content
-        print("\n=== APIレスポンス受信 ===")
-        
-        # マークダウンのコードブロック記法を削除
-        yaml_text = yaml_text.replace('```yaml', '').replace('```', '').strip()
-        
-        # YAMLとして解析
-        try:
-            yaml_data = yaml.safe_load(yaml_text)
-            print(f"パート {part_num+1} のYAML解析に成功")
-            return yaml_data
-        except yaml.YAMLError as e:
-            print(f"パート {part_num+1} のYAML解析に失敗: {str(e)}")
-            raise
-            
-    except Exception as e:
-        print(f"パート {part_num+1} の処理中にエラー: {str(e)}")
-        raise
+    
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        raise ValueError("レスポンスが出力トークンの上限に達しました")
+    
+    yaml_parts = json.loads(choice.message.content)["parts"]
+    if len(yaml_parts) != total_parts:
+        raise ValueError(f"解析結果のパート数が一致しません（期待値: {total_parts}）")
+    
+    # パートごとの解析と同じキーでキャッシュし、再実行時に再利用できるようにする
+    for i, (part, yaml_data) in enumerate(zip(parts, yaml_parts)):
+        _store_part_cache(_part_cache_key(part, i, total_parts), yaml_data)
+    
+    log.debug("全パートの一括解析に成功")
+    return yaml_parts
+
+def build_part_requests(text: str, num_parts: int = 8) -> List[Dict[str, Any]]:
+    """
+    テキストを分割し、パートごとの解析リクエスト本文を作成する
+    
+    Args:
+        text (str): 解析するテキスト
+        num_parts (int): 分割数（デフォルト: 8）
+    
+    Returns:
+        List[Dict[str, Any]]: Chat Completionsのリクエスト本文のリスト
+    """
+    text_parts = split_text(text, num_parts=num_parts)
+    if not text_parts:
+        raise ValueError("解析するテキストが存在しません。")
+    return [
+        _part_request_body(part, i, len(text_parts))
+        for i, part in enumerate(text_parts)
+    ]
+
+def submit_batch(client: OpenAI, requests: List[Dict[str, Any]]) -> str:
+    """
+    リクエストをJSONLにまとめてOpenAI Batch APIに投入する
+    
+    Args:
+        client (OpenAI): OpenAIクライアント
+        requests (List[Dict[str, Any]]): Chat Completionsのリクエスト本文のリスト
+    
+    Returns:
+        str: バッチID
+    """
+    buffer = io.BytesIO()
+    for i, body in enumerate(requests):
+        line = {
+            "custom_id": f"part_{i}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body
+        }
+        buffer.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+    buffer.seek(0)
+    
+    batch_file = client.files.create(file=("batch_input.jsonl", buffer), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    log.info("バッチを投入しました: %s（リクエスト数: %d）", batch.id, len(requests))
+    return batch.id
 
-async def summarize_with_openai_async(client: AsyncOpenAI, content: str, max_tokens: int = 300000) -> str:
+def retrieve_batch_results(client: OpenAI, batch_id: str, num_requests: int) -> Optional[List[Dict[str, Any]]]:
+    """
+    バッチの状態を確認し、完了していればパートごとの解析結果を返す
+    
+    Args:
+        client (OpenAI): OpenAIクライアント
+        batch_id (str): バッチID
+        num_requests (int): 投入したリクエスト数
+    
+    Returns:
+        Optional[List[Dict[str, Any]]]: パート順の解析結果（未完了の場合はNone）
+    """
+    batch = client.batches.retrieve(batch_id)
+    if batch.status in ("validating", "in_progress", "finalizing"):
+        return None
+    if batch.status != "completed":
+        raise Exception(f"バッチ処理が完了しませんでした（状態: {batch.status}）")
+    if batch.request_counts.failed:
+        raise Exception(f"バッチ内で{batch.request_counts.failed}件のリクエストが失敗しました（エラーファイル: {batch.error_file_id}）")
+    if not batch.output_file_id:
+        raise Exception(f"バッチの出力ファイルが存在しません（エラーファイル: {batch.error_file_id}）")
+    
+    # 結果はcustom_id順に並ばないため、custom_idで索引してから並べ直す
+    contents = {}
+    output = client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            raise Exception(f"{record.get('custom_id')} の処理に失敗しました: {record.get('error')}")
+        contents[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    
+    missing = [f"part_{i}" for i in range(num_requests) if f"part_{i}" not in contents]
+    if missing:
+        raise Exception(f"バッチの結果に {', '.join(missing)} が含まれていません")
+    
+    return [
+        _parse_part_response(contents[f"part_{i}"], i)
+        for i in range(num_requests)
+    ]
+
+async def summarize_with_openai_async(client: AsyncOpenAI, content: str, max_tokens: int = 300000,
+                                      response_format: Optional[Dict[str, Any]] = None) -> str:
     """
     OpenAI APIを使用してコンテンツを非同期で要約する
+    （response_format を指定した場合はその形式で出力させる。失敗した場合は例外を送出する）
     """
-    try:
+    async with _SEM:
         response = await client.chat.completions.create(
-            model="gpt-4.1-2025-04-14",
+            model=SUMMARIZE_MODEL,
             messages=[
-                {"role": "system", "content": "与えられたテキストを自然な形で要約してください。重要なポイントを保持しながら、箇条書きの場合は文章を途中で切らないように注意してください。"},
-                {"role": "user", "content": f"以下のテキストを要約してください。箇条書きの場合は、各項目が完結するように要約してください：\n\n{content}"}
+                {"role": "system", "content": SUMMARIZE_SYSTEM_PROMPT},
+                {"role": "user", "content": content}
             ],
-            max_tokens=300000,  # 10M tokens
+            max_completion_tokens=min(max_tokens, SUMMARIZE_MAX_TOKENS),
+            response_format=response_format or NOT_GIVEN,
             temperature=0.7
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"要約中にエラーが発生しました: {str(e)}")
-        return truncate_content(content, max_tokens)
+    return response.choices[0].message.content.strip()
+
+# _estimate_size に対する yaml.dump 後の文字数の比（キー名・インデント・引用符の分）
+# SYSTEM_PROMPTが求める形（タイトル20文字、30-50文字の内容5-7項目、30-50文字の指導のポイント3-5項目、
+# 1セクション3-7スライド）の文書で計測した値（1.31〜1.36、平均1.33）
+_YAML_OVERHEAD_RATIO = 1.33
+
+def _estimate_size(yaml_data: Dict[str, Any]) -> int:
+    """
+    YAMLデータをシリアライズせずに、スライドのテキスト長の合計から文字数を見積もる
+    """
+    size = 0
+    for section in yaml_data.get("sections", []):
+        for slide in section.get("slides", []):
+            size += len(slide.get("title", ""))
+            for key in ("content", "teaching_points"):
+                value = slide.get(key, "")
+                size += sum(map(len, value)) if isinstance(value, list) else len(str(value))
+    return size
 
-async def adjust_yaml_size_async(yaml_data: Dict[str, Any], client: AsyncOpenAI, max_chars: int = 10000) -> Dict[str, Any]:
+async def adjust_yaml_size_async(yaml_data: Dict[str, Any], client: AsyncOpenAI, max_chars: int = 10000,
+                                 fallbacks: Optional[List[Exception]] = None) -> Dict[str, Any]:
     """
     YAMLデータのサイズを非同期で調整する
+    （要約・拡充に失敗して元の内容を残した場合は、その例外を fallbacks に追加する）
     """
-    current_size = len(yaml.dump(yaml_data, allow_unicode=True))
+    if fallbacks is None:
+        fallbacks = []
+
+    current_size = _estimate_size(yaml_data) * _YAML_OVERHEAD_RATIO
     
     # 文字数が少なすぎる場合（8000文字未満）は内容を拡充
     if current_size < 8000:
         adjusted_data = yaml_data.copy()
         
+        # 拡充リクエストを先に集め、まとめて並列実行する
+        coros = []
+        meta = []
+        
         # 各セクションのスライドの内容を拡充
         for section in adjusted_data.get("sections", []):
             for slide in section.get("slides", []):
                 # コンテンツの拡充
                 if "content" in slide and isinstance(slide["content"], list):
                     content_text = "\n".join(slide["content"])
-                    expansion_prompt = f"""
-                    以下の内容をより詳細に展開してください：
-                    - 各ポイントに具体例を追加
-                    - 関連する補足情報を含める
-                    - 実践的な応用例を追加
-                    
-                    元の内容：
-                    {content_text}
-                    """
-                    expanded_content = await summarize_with_openai_async(client, expansion_prompt, 300000)
-                    slide["content"] = [point.strip() for point in expanded_content.split("\n") if point.strip()]
+                    expansion_prompt = CONTENT_EXPANSION_PROMPT.format(content_text=content_text)
+                    coros.append(summarize_with_openai_async(client, expansion_prompt, 300000))
+                    meta.append(("content", slide))
                 
                 # 指導ポイントの拡充
                 if "teaching_points" in slide:
                     points_text = slide["teaching_points"] if isinstance(slide["teaching_points"], str) else "\n".join(slide["teaching_points"])
-                    points_prompt = f"""
-                    以下の指導ポイントをより詳細に展開してください：
-                    - 具体的な指導方法を追加
-                    - 予想される質問や疑問点への対応
-                    - 実践的なアドバイスを含める
-                    
-                    元のポイント：
-                    {points_text}
-                    """
-                    expanded_points = await summarize_with_openai_async(client, points_prompt, 300000)
-                    slide["teaching_points"] = [point.strip() for point in expanded_points.split("\n") if point.strip()]
+                    points_prompt = TEACHING_POINTS_EXPANSION_PROMPT.format(points_text=points_text)
+                    coros.append(summarize_with_openai_async(client, points_prompt, 300000))
+                    meta.append(("teaching_points", slide))
+        
+        results = await asyncio.gather(*coros, return_exceptions=True)
+        
+        # 並列処理の結果を適用
+        for (key, slide), result in zip(meta, results):
+            if isinstance(result, Exception):
+                log.warning("拡充中にエラーが発生しました: %s", result)
+                fallbacks.append(result)
+                continue
+            slide[key] = [point.strip() for point in result.split("\n") if point.strip()]
         
         return adjusted_data
     
@@ -201,8 +557,9 @@ async def adjust_yaml_size_async(yaml_data: Dict[str, Any], client: AsyncOpenAI,
     
     adjusted_data = yaml_data.copy()
     
-    # 並列で処理するタスクのリスト
-    tasks = []
+    # 並列で処理するコルーチンと、結果の適用先
+    coros = []
+    meta = []
     
     # 各セクションのスライドの内容を制限
     for section in adjusted_data.get("sections", []):
@@ -212,35 +569,42 @@ async def adjust_yaml_size_async(yaml_data: Dict[str, Any], client: AsyncOpenAI,
                     # 箇条書きの場合は、各項目を個別に処理
                     if len(slide["content"]) > 5:
                         combined_points = "\n".join(slide["content"])
-                        tasks.append(("content_limit", slide, await summarize_with_openai_async(client, 
-                            f"以下の内容を5つの重要なポイントにまとめてください。各ポイントは完結した文章にしてください：\n{combined_points}", 300000)))
+                        coros.append(summarize_with_openai_async(client, 
+                            CONTENT_LIMIT_PROMPT.format(combined_points=combined_points), 300000))
+                        meta.append(("content_limit", slide, None))
                     else:
-                        # 5項目以下の場合は、各項目を個別に要約
-                        new_content = []
-                        for item in slide["content"]:
-                            summarized_item = await summarize_with_openai_async(client, item, 300000)
-                            new_content.append(summarized_item)
-                        tasks.append(("content", slide, new_content))
+                        # 5項目以下の場合は、各項目を個別に要約（元のリストは共有されうるため複製してから書き換える）
+                        slide["content"] = list(slide["content"])
+                        for index, item in enumerate(slide["content"]):
+                            coros.append(summarize_with_openai_async(client, item, 300000))
+                            meta.append(("content_item", slide, index))
                 else:
-                    tasks.append(("content", slide, await summarize_with_openai_async(client, str(slide["content"]), 300000)))
+                    coros.append(summarize_with_openai_async(client, str(slide["content"]), 300000))
+                    meta.append(("content", slide, None))
             
             if "teaching_points" in slide:
-                tasks.append(("teaching_points", slide, await summarize_with_openai_async(client, str(slide["teaching_points"]), 300000)))
+                coros.append(summarize_with_openai_async(client, str(slide["teaching_points"]), 300000))
+                meta.append(("teaching_points", slide, None))
+    
+    results = await asyncio.gather(*coros, return_exceptions=True)
     
     # 並列処理の結果を適用
-    for task_type, slide, result in tasks:
+    for (task_type, slide, index), result in zip(meta, results):
+        if isinstance(result, Exception):
+            log.warning("要約中にエラーが発生しました: %s", result)
+            fallbacks.append(result)
+            continue
         if task_type == "content":
-            if isinstance(result, list):
-                slide["content"] = result
-            else:
-                slide["content"] = [point.strip() for point in result.split("\n") if point.strip()]
+            slide["content"] = [point.strip() for point in result.split("\n") if point.strip()]
+        elif task_type == "content_item":
+            slide["content"][index] = result
         elif task_type == "content_limit":
             slide["content"] = [point.strip() for point in result.split("\n") if point.strip()][:5]
         elif task_type == "teaching_points":
             slide["teaching_points"] = result
     
     # 再度サイズを確認
-    final_size = len(yaml.dump(adjusted_data, allow_unicode=True))
+    final_size = _estimate_size(adjusted_data) * _YAML_OVERHEAD_RATIO
     if final_size > max_chars:
         for section in adjusted_data.get("sections", []):
             slides = section.get("slides", [])
@@ -249,229 +613,208 @@ async def adjust_yaml_size_async(yaml_data: Dict[str, Any], client: AsyncOpenAI,
                     f"スライド {slide['number']}: {slide['title']}\n{slide.get('content', '')}\n{slide.get('teaching_points', '')}"
                     for slide in slides
                 ])
-                summary_prompt = f"""
-                以下のスライド群を10個の重要なスライドに要約してください。
-                各スライドには以下の情報を含めてください：
-                - タイトル
-                - 内容（箇条書き）
-                - 講義台本
-                
-                元のスライド内容：
-                {combined_slides}
-                """
-                summarized_slides = await summarize_with_openai_async(client, summary_prompt, 1000)
+                summary_prompt = SLIDE_SUMMARY_PROMPT.format(combined_slides=combined_slides)
                 try:
-                    summarized_data = yaml.safe_load(summarized_slides)
-                    print(f"要約データの型: {type(summarized_data)}")
-                    print(f"要約データの内容: {summarized_data}")
+                    # 不完全なJSONは解析できないため、10スライド分が収まる出力トークン数を確保する
+                    summarized_slides = await summarize_with_openai_async(
+                        client, summary_prompt, 8000, response_format={"type": "json_object"}
+                    )
+                    slides_data = json.loads(summarized_slides)["slides"]
+                    log.debug("要約後のスライド数: %d", len(slides_data))
                     
                     def create_slide_dict(slide_data, index):
-                        if isinstance(slide_data, dict):
-                            return {
-                                "number": str(index + 1),
-                                "title": slide_data.get("title", ""),
-                                "content": slide_data.get("content", []),
-                                "teaching_points": slide_data.get("teaching_points", "")
-                            }
-                        elif isinstance(slide_data, str):
-                            return {
-                                "number": str(index + 1),
-                                "title": slide_data,
-                                "content": [],
-                                "teaching_points": ""
-                            }
-                        else:
-                            return {
-                                "number": str(index + 1),
-                                "title": "スライド " + str(index + 1),
-                                "content": [],
-                                "teaching_points": ""
-                            }
-
-                    if isinstance(summarized_data, dict):
-                        print("辞書型のデータを処理中...")
-                        if "slides" in summarized_data:
-                            slides_data = summarized_data["slides"]
-                        else:
-                            slides_data = [summarized_data]
-                    elif isinstance(summarized_data, list):
-                        print("リスト型のデータを処理中...")
-                        slides_data = summarized_data
-                    else:
-                        print("未知の型のデータを処理中...")
-                        slides_data = [str(summarized_data)]
+                        return {
+                            "number": str(index + 1),
+                            "title": slide_data.get("title", ""),
+                            "content": slide_data.get("content", []),
+                            "teaching_points": slide_data.get("teaching_points", "")
+                        }
 
                     section["slides"] = [create_slide_dict(slide, i) for i, slide in enumerate(slides_data)]
 
                 except Exception as e:
-                    print(f"\n=== スライドの要約処理中にエラー ===")
-                    print(f"エラーの種類: {type(e).__name__}")
-                    print(f"エラーの詳細: {str(e)}")
-                    print(f"summarized_slides の内容: {summarized_slides}")
-                    print(f"現在の section の内容: {section}")
+                    log.warning("スライドの要約処理中にエラー（セクション: %s）: %s: %s", section.get("name"), type(e).__name__, e)
+                    fallbacks.append(e)
+                    # 要約できなかった場合は先頭の10スライドをそのまま残す
                     section["slides"] = [
-                        {
-                            "number": str(i+1),
-                            "title": str(slide),
-                            "content": [],
-                            "teaching_points": ""
-                        }
+                        {**slide, "number": str(i+1)}
                         for i, slide in enumerate(slides[:10])
                     ]
     
     return adjusted_data
 
-def analyze_content(client: OpenAI, text: str) -> Dict[str, Any]:
+@dataclass
+class SectionSoA:
     """
-    OpenAI APIを使用してテキストを解析し、構造化する
+    マージ中のセクションのスライドを、項目ごとのリスト（列指向）で保持する
     """
-    try:
-        # 非同期クライアントの作成
-        async_client = AsyncOpenAI(api_key=client.api_key)
-        
-        # テキストを8部分に分割
-        text_parts = split_text(text, num_parts=8)
-        print(f"テキストを8部分に分割しました。")
-        
-        # 非同期処理を実行
-        async def process_all_parts():
-            try:
-                print("\n=== 全パートの並列処理を開始 ===")
-                # 全パートを並列で解析
-                tasks = [
-                    analyze_content_part(async_client, part, i, len(text_parts))
-                    for i, part in enumerate(text_parts)
-                ]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # エラーチェック
-                errors = [r for r in results if isinstance(r, Exception)]
-                if errors:
-                    print("\n=== パート処理中にエラーが発生 ===")
-                    for i, error in enumerate(errors):
-                        print(f"エラー {i+1}:")
-                        print(f"種類: {type(error).__name__}")
-                        print(f"詳細: {str(error)}")
-                    raise Exception(f"パート処理中に{len(errors)}件のエラーが発生しました")
-                
-                return results
-            except Exception as e:
-                import traceback
-                print("\n=== process_all_parts でエラー発生 ===")
-                print(f"エラーの種類: {type(e).__name__}")
-                print(f"エラーの詳細: {str(e)}")
-                print("スタックトレース:")
-                traceback.print_exc()
-                raise
-        
-        # 非同期処理を実行
-        yaml_parts = asyncio.run(process_all_parts())
-        
-        print("\n=== 全パートの解析が完了しました ===")
-        print(f"解析されたパート数: {len(yaml_parts)}")
-        print(f"戻り値の型: {type(yaml_parts)}")
-        print(f"最初のパートの型: {type(yaml_parts[0]) if yaml_parts else 'なし'}")
-        
-        if not yaml_parts:
-            raise ValueError("解析されたパートが存在しません。")
-        
-        # 講義名を取得
-        lecture_name = yaml_parts[0].get("lecture_name")
-        if lecture_name is None:
-            raise ValueError(f"lecture_nameが見つかりません。")
-        
-        # セクションごとにスライドをグループ化
-        sections_dict = {}
-        section_order = []
+    titles: List[str] = field(default_factory=list)
+    contents: List[List[str]] = field(default_factory=list)
+    teaching: List[List[str]] = field(default_factory=list)
+    
+    def to_slides(self) -> List[Dict[str, Any]]:
+        """
+        YAML出力用のスライドの辞書のリストに変換する
+        """
+        teaching_points = list(map("\n".join, self.teaching))
+        return [
+            {
+                "number": str(slide_num),
+                "title": title,
+                "content": content,
+                "teaching_points": points
+            }
+            for slide_num, (title, content, points) in enumerate(zip(self.titles, self.contents, teaching_points), 1)
+        ]
+
+def _raise_if_errors(results: List[Any], stage: str) -> None:
+    """
+    asyncio.gather(return_exceptions=True) の結果に例外が含まれていれば送出する
+    """
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        # 画面に表示するメッセージは件数のみとし、個々のエラー内容は
+        # 連結した例外グループとして呼び出し元のログ出力に任せる
+        raise Exception(f"{stage}中に{len(errors)}件のエラーが発生しました") from ExceptionGroup(stage, errors)
+
+async def _analyze_parts(async_client: AsyncOpenAI, text_parts: List[str]) -> List[Dict[str, Any]]:
+    """
+    全パートを解析する（見込みの出力が上限に収まる場合は1リクエストで解析し、
+    それ以外の場合や失敗した場合はパートごとに並列で解析する）
+    """
+    if not text_parts:
+        raise ValueError("解析するテキストが存在しません。")
+    
+    if len(text_parts) * ANALYSIS_PART_OUTPUT_TOKENS <= COMBINED_ANALYSIS_MAX_TOKENS:
+        try:
+            return await analyze_all_parts(async_client, text_parts)
+        except Exception as e:
+            log.warning("一括解析に失敗したため、パートごとの解析に切り替えます: %s", e)
+    
+    log.debug("全パートの並列処理を開始")
+    tasks = [
+        analyze_content_part(async_client, part, i, len(text_parts))
+        for i, part in enumerate(text_parts)
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    _raise_if_errors(results, "パート処理")
+    return results
+
+async def _finalize_yaml_parts(async_client: AsyncOpenAI, yaml_parts: List[Dict[str, Any]],
+                               fallbacks: Optional[List[Exception]] = None) -> List[Dict[str, Any]]:
+    """
+    パートごとの解析結果をセクション単位にまとめ、ファイルごとにサイズを非同期で調整する
+    （サイズ調整で元の内容を残した場合は、その例外を fallbacks に追加する）
+    """
+    if not yaml_parts:
+        raise ValueError("解析されたパートが存在しません。")
+    
+    # 講義名を取得（スキーマで必須のため常に存在する）
+    lecture_name = yaml_parts[0]["lecture_name"]
+    
+    # セクションごとにスライドをグループ化
+    sections_dict: Dict[str, SectionSoA] = {}
+    section_order = []
+    
+    for part_num, part in enumerate(yaml_parts, 1):
+        sections = part["sections"]
+        log.debug("パート%d のセクション数: %d", part_num, len(sections))
         
-        for part_num, part in enumerate(yaml_parts, 1):
-            print(f"\n=== パート{part_num}の処理 ===")
+        for section in sections:
+            section_name = section["name"]
+            if not section_name:
+                continue
             
-            sections = part.get("sections", [])
-            print(f"セクション数: {len(sections)}")
+            if section_name not in sections_dict:
+                sections_dict[section_name] = SectionSoA()
+                section_order.append(section_name)
             
-            for section in sections:
-                section_name = section.get("name")
-                if not section_name:
-                    continue
-                
-                if section_name not in sections_dict:
-                    sections_dict[section_name] = []
-                    section_order.append(section_name)
-                
-                for slide_num, slide in enumerate(section.get("slides", []), 1):
-                    slide_data = {
-                        "number": str(slide_num),
-                        "title": slide["title"],
-                        "content": slide["content"],
-                        "teaching_points": "\n".join(slide.get("teaching_points", []))
-                    }
-                    sections_dict[section_name].append(slide_data)
-        
-        # 最終的なYAML構造を作成（8ファイルに分割）
-        final_yaml = []
-        sections_per_file = max(1, len(section_order) // 8)
-        
-        async def process_all_files():
-            try:
-                print("\n=== ファイル処理を開始 ===")
-                tasks = []
-                for i in range(8):
-                    start_idx = i * sections_per_file
-                    end_idx = (i + 1) * sections_per_file if i < 7 else len(section_order)
-                    
-                    file_sections = []
-                    for section_num, section_name in enumerate(section_order[start_idx:end_idx], 1):
-                        section_data = {
-                            "number": str(section_num),
-                            "name": section_name,
-                            "slides": sections_dict[section_name]
-                        }
-                        file_sections.append(section_data)
-                    
-                    if file_sections:
-                        yaml_file = {
-                            "lecture_name": lecture_name,
-                            "sections": file_sections
-                        }
-                        tasks.append(adjust_yaml_size_async(yaml_file, async_client))
-                
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                # エラーチェック
-                errors = [r for r in results if isinstance(r, Exception)]
-                if errors:
-                    print("\n=== ファイル処理中にエラーが発生 ===")
-                    for i, error in enumerate(errors):
-                        print(f"エラー {i+1}:")
-                        print(f"種類: {type(error).__name__}")
-                        print(f"詳細: {str(error)}")
-                    raise Exception(f"ファイル処理中に{len(errors)}件のエラーが発生しました")
-                
-                return results
-            except Exception as e:
-                import traceback
-                print("\n=== process_all_files でエラー発生 ===")
-                print(f"エラーの種類: {type(e).__name__}")
-                print(f"エラーの詳細: {str(e)}")
-                print("スタックトレース:")
-                traceback.print_exc()
-                raise
+            merged = sections_dict[section_name]
+            for slide in section["slides"]:
+                merged.titles.append(slide["title"])
+                merged.contents.append(slide["content"])
+                merged.teaching.append(slide["teaching_points"])
+    
+    # 最終的なYAML構造を作成（8ファイルに分割）
+    sections_per_file = max(1, len(section_order) // 8)
+    
+    log.debug("ファイル処理を開始")
+    tasks = []
+    for i in range(8):
+        start_idx = i * sections_per_file
+        end_idx = (i + 1) * sections_per_file if i < 7 else len(section_order)
         
-        # 非同期でファイルサイズの調整を実行
-        final_yaml = asyncio.run(process_all_files())
+        file_sections = []
+        for section_num, section_name in enumerate(section_order[start_idx:end_idx], 1):
+            section_data = {
+                "number": str(section_num),
+                "name": section_name,
+                "slides": sections_dict[section_name].to_slides()
+            }
+            file_sections.append(section_data)
         
-        print("\n=== 最終的なYAMLデータの情報 ===")
-        print(f"ファイル数: {len(final_yaml)}")
-        print(f"データ型: {type(final_yaml)}")
+        if file_sections:
+            yaml_file = {
+                "lecture_name": lecture_name,
+                "sections": file_sections
+            }
+            tasks.append(adjust_yaml_size_async(yaml_file, async_client, fallbacks=fallbacks))
+    
+    final_yaml = await asyncio.gather(*tasks, return_exceptions=True)
+    _raise_if_errors(final_yaml, "ファイル処理")
+    
+    log.debug("最終的なファイル数: %d", len(final_yaml))
+    
+    return final_yaml
+
+def finalize_yaml_parts(async_client: AsyncOpenAI, yaml_parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    パートごとの解析結果をセクション単位にまとめ、ファイルごとにサイズを調整する
+    
+    Args:
+        async_client (AsyncOpenAI): 非同期OpenAIクライアント
+        yaml_parts (List[Dict[str, Any]]): パート順の解析結果
+    
+    Returns:
+        List[Dict[str, Any]]: 調整済みのYAMLデータのリスト
+    """
+    return run_async(_finalize_yaml_parts(async_client, yaml_parts))
+
+def analyze_content(async_client: AsyncOpenAI, text: str) -> Dict[str, Any]:
+    """
+    OpenAI APIを使用してテキストを解析し、構造化する
+    （結果はディスクにキャッシュし、同じテキストの再解析ではAPIを呼び出さない）
+    """
+    cached = _load_cached_result(text)
+    if cached is not None:
+        return cached
+    
+    # サイズ調整で要約・拡充に失敗し、元の内容を残した箇所
+    fallbacks: List[Exception] = []
+    
+    # パートの解析からファイルサイズの調整までを1つのイベントループ上で続けて実行する
+    async def pipeline(text_parts: List[str]) -> List[Dict[str, Any]]:
+        yaml_parts = await _analyze_parts(async_client, text_parts)
+        log.debug("全パートの解析が完了しました（パート数: %d）", len(yaml_parts))
+        return await _finalize_yaml_parts(async_client, yaml_parts, fallbacks)
+    
+    try:
+        # テキストを8部分に分割
+        text_parts = split_text(text, num_parts=8)
+        log.debug("テキストを%d部分に分割しました", len(text_parts))
         
-        return final_yaml
+        result = run_async(pipeline(text_parts))
         
     except Exception as e:
-        print(f"\n=== エラーが発生しました ===")
-        print(f"エラーの種類: {type(e).__name__}")
-        print(f"エラーの詳細: {str(e)}")
-        raise Exception(f"OpenAI APIでの解析中にエラーが発生しました: {str(e)}")
+        # ログ出力は呼び出し元（アプリの処理）で1回だけ行う
+        raise Exception(f"OpenAI APIでの解析中にエラーが発生しました: {str(e)}") from e
+    
+    # サイズ調整が不完全な結果は、次回のアップロードで再調整できるようキャッシュしない
+    if fallbacks:
+        log.warning("サイズ調整の%d件が失敗したため、解析結果をキャッシュしません", len(fallbacks))
+    else:
+        _store_cached_result(text, result)
+    return result
 
 def check_and_split_yaml(yaml_data: Dict[str, Any], num_parts: int = 8) -> List[Dict[str, Any]]:
     """
@@ -496,27 +839,35 @@ def check_and_split_yaml(yaml_data: Dict[str, Any], num_parts: int = 8) -> List[
         # ファイルエントリの総数を取得
         total_files = len(yaml_data["file"])
         
-        # 1パートあたりのファイル数を計算
-        files_per_part = math.ceil(total_files / num_parts)
+        # 各パートのファイル数を均等に割り振る（先頭のr個のパートに1つずつ多く配る）
+        q, r = divmod(total_files, num_parts)
+        sizes = [q + 1] * r + [q] * (num_parts - r)
+        offsets = list(itertools.accumulate(sizes, initial=0))
         
-        # YAMLデータを分割
-        yaml_files = []
-        for i in range(0, total_files, files_per_part):
-            part_files = yaml_data["file"][i:i + files_per_part]
-            if part_files:  # 空のパートは除外
-                part_yaml = {
-                    "lecture_name": yaml_data["lecture_name"],
-                    "file": part_files
-                }
-                yaml_files.append(part_yaml)
-        
-        return yaml_files
+        # YAMLデータを分割（空のパートは除外）
+        return [
+            {
+                "lecture_name": yaml_data["lecture_name"],
+                "file": yaml_data["file"][offsets[i]:offsets[i + 1]]
+            }
+            for i in range(num_parts)
+            if offsets[i + 1] > offsets[i]
+        ]
 
     # その他の型の場合は、単一要素のリストとして返す
     return [{"lecture_name": "Unknown", "sections": []}]
 
+# プレビューとファイル出力で共通のYAML書式
+_YAML_DUMP_OPTIONS = {"allow_unicode": True, "sort_keys": False, "indent": 2}
+
 def format_yaml_for_preview(yaml_data: Dict[str, Any]) -> str:
     """
     YAMLデータをプレビュー用に整形する
     """
-    return yaml.dump(yaml_data, allow_unicode=True, sort_keys=False, indent=2) 
\ No newline at end of file
+    return yaml.dump(yaml_data, Dumper=_Dumper, **_YAML_DUMP_OPTIONS)
+
+def write_yaml(yaml_data: Dict[str, Any], stream) -> None:
+    """
+    YAMLデータをプレビューと同じ書式でバイナリストリームにUTF-8で書き出す
+    """
+    yaml.dump(yaml_data, stream, Dumper=_Dumper, encoding="utf-8", **_YAML_DUMP_OPTIONS)